@@ -1,23 +1,92 @@
+from __future__ import annotations
+
 import streamlit as st
-from openai import OpenAI, RateLimitError
-from docx import Document
-from docx.shared import Cm
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+import diskcache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+import asyncio
 import base64
-import tiktoken
+import functools
+import hashlib
+import hmac
+import io
+import json
 import os
-import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Union
+from xml.sax.saxutils import escape
+
+# openai, docx, PIL and tiktoken are imported where they are used. Streamlit
+# re-executes this script on every widget interaction, and the login and
+# upload screens should not pay for loading them.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from PIL import Image
 
 # === CONFIG ===
-client = OpenAI(api_key=st.secrets["api"]["key"])
+MAX_CONCURRENT_REQUESTS = 8
+MAX_ATTEMPTS = 4
+ENCODE_WORKERS = min(8, os.cpu_count() or 1)
+BATCH_DISCOUNT = 0.5          # Batch API is billed at half the synchronous price
+BATCH_POLL_MAX_DELAY = 60     # seconds between status checks, at most
+BATCH_CHUNK_SIZE = 50         # images per Batch API job
+BATCH_RESUME_TTL = 30 * 24 * 3600  # seconds a submitted job is remembered for resuming
+MAX_IMAGE_EDGE = 1024         # px; photos are downscaled to fit before upload
+JPEG_QUALITY = 85
+IMAGE_DETAIL = "auto"         # "low" is cheaper still, but can miss hairline cracks
+PASSTHROUGH_MAX_BYTES = 512 * 1024  # upright JPEGs under this and MAX_IMAGE_EDGE skip re-encoding
+B64_CHUNK = 57 * 1024         # multiple of 3, so chunks encode without mid-stream padding
+REPORT_FILENAME = "output_report.docx"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+CACHE_DIR = ".precon_cache"   # on-disk (image, prompt) -> comment cache, shared across sessions
+_EXT_RE = re.compile(r"\.(?:jpe?g|png)\Z", re.IGNORECASE)  # accepted upload extensions
+
+# === LOGO BASE64 ===
+LOGO_BASE64 = """
+iVBORw0KGgoAAAANSUhEUgAAAOoAAADYCAMAAADS+I/aAAABAlBMVEX///8kMl4AAADzVycAGFL39/nyRgDzVSQiMF0SJVcdLVvzVSUAHVQcLFvzSADzUyAAEU8AFFAAAEqTl6gYKVnzTxgAF1EAE08LIVVQWHjzThTw8PLExs//+vgAHlQAD0+ws8D82tL+8/BeZYEOABHn5+j+7Of9492PlKb5q5rGyNADAAn6uar7y8D0ZTz0XzL3lH34oY14fpTb3OE+SG2xsbP2gWT6wLL1elv7z8X1b0sXDhmbmp2KiYwhGyNOS1F0cnb4mIL4ppMxPWZoboehpbOtrK9hX2RCP0U1MTiVlJfT09X3i3LyOwD0akVwdYvExMVram5KR00AADtHT3EeGSPXp+InAAAc6klEQVR4nNVdCVuyTBc2UARBsBIjzH3XbFHLyjJLrcwWe776/3/lOzOgojAIpNV7P9f1VIjj3JwzZ5tFn2/DyJycbvoj/giKr7L48tud+BlcMrx09Nud+BkkaPH18Lc7sVEUX9r6b4l6aXoxkfX5sod39xnDjYlS0eLt2cPT08PLxEa7uB5kzxnxbv5nAvc588q8FuuMKqvMbPAW4UbmOOM7rF9mjQ3UX2W4jXmxegx/C9nX+QBtXxy/1tEvRYaXT0RJ4mma0VU6w8g8zUtimxFfjaL2wRNRZZ6Xxcsf7bcXHAV5uX16jKR5KAbVCrqWYGhaUt9eVJ4PqviurBikeVFlJBnYLwgwc3p4+KJKdJDJmhv/S0hk3iSeV2UGSepSpOUTfBmoyqDWRZGnGTx+T1U6GCz5iseIsXlgZuG69pT+LjKvQZqmefX1Hv4oibR0hS+LPC8iIb1ItFrXLtAifhoqzdMW7RyqtPRXffJUMqLK08GjNhYd6C0va1dB0uhnRaVVZJ9LDB3EDNHTeLNo7k6eSzVbubiaWfXfRv1cYuQ7zPakEoQBqV8Hy4OFCQOYZtDLiCqyS3VgeI5eKE1/mePkrl2/A2FPh3BdVCVJEo//gkmuS6IUBHsjaZK9kGaGBn4VsXzf4BrifKhTbU/1ExRYH84ziDIywSpT1/5sM0EwaTIY6983UydMUBZVGHyyJp57WR+PYHymv17p9IGijEZxRgQtRy8g7ovmJ/OqSnzwqKI/rRIDDV/VKyq//Eh+FCU8gI5k8b7oK4J50YRZBzp6RjMV4ky8s9eQWUIP4UjS75gjUX+D8T71tUcSL13AzxPZylL/FC5fRfSjJCGGpaupe8gyU7s79zbnkm5wRex0wOzAYFRPKsBUs1OLAF6aT/K1RbgP+2h1eunHUcr4VF4TCPSkfsRAKBQ8xi8dB3l9XBWnrE9kGkc/GZGX8RhN0CgiUiFU0J7BIhKiJkrUli51MGgWN/4AMufMEXRb1V3iCwOGg56GB8BLuqqfgKwTSHb4EsPgEDEDAa7mLhMoBGYq4GiNwjrUdRTCKqwxGXBXEr5yLi1GVe2f0uY2SkV58V77PAj4mMrMkUAUi8JAbEFpVX1FAr5s1y9xRw0dLF5CnI9M8/xaljnGVqyt6n4Y7Jo+7tEVI7srqb4RZkVTjEaD95wanwzDIztbnMVGbzIKmNAgva+0M3aPHyJFY/Z+IQfF49PKCTLnWPhvU6HDINdVWseRxJyvX7CJU+Z12SKAbZ2NHYhskNOEganrWPaCYcRz28ykfYFazAIVo685FGU+KKvoSWkMVV4f/xdTS32k8wODwHybmQnn8OinJrU9NQ0QCKk6GbCXyIqeo0t6v7OrQptzlZHf3kSJ5hcig+ILA6FRENQftw3GXJMuBJI8kwX29aloVd4yoPwmsuDFReQRDlWUdmljBEbRNKKDuICXL45lOqgyVw6bfAUDLEFmIDFLws8evhwdX1Sy+ifrQ/VcQpb7/PjyqOSbvbKJkAJnXGDvGRigfJDBkivi54xfTiCXIUmvl/VDx7Fb5kVkRFFkrux9pRTEhOr62ChevOpOGD5e16CT9ZqnIKjmfYIBRwjCoLXoFKz/1C6VQNqi6vYji5lLW5OFAGNDLkGMBZ+PP+uifapZCIgssaMuHavM+TqDYxSzBF8k8bR+j6oH2OpnpokZINGubKbwBREwL0oqCoPRnxmwUVlMrC7izKcCkQsvvq4z6YFwnZewCcyoU+PzZg5f1486g/QoKF7hJ3k/05xDNSj7EhfwJCTmbq0pD0Qt4Fzwx0GkoDkAlIg5qmgHCs3qQXq38f6e+9SRe39/3x0eVJuFwIo3l84hqAqa/HpFlc5LMphG5nzdkfELKndpTy84TWFkmaFtVSferO7mPlvbEb+QVLhoNBoOh0MA+AF/cIog+Ldj/c/cbrUZJ7eSKFp8CDgAHkWPb+uPi7NoZGrqikJ3/AH3F+TPiVeH7629mMCFQ+yWLdhQmBP8e/3B7oEN32WAUQSu0kbKMBVVr4Th4MhWacbpQV8QuGjInuMS4zCX3O4P0mNHvUEDSmLWWlLMHp5WdFq0pOdfEP6qxDfE0wMlpkTZFaIk8lX8wiBdWNkvyO2ki7Xa/IqI5h40v3WJVPjlso4M75317eNha1uJeiJpQFSJ9XcPbPt1rxoDytLl9y0TqhqpQVoO4lYvUEwkQmSkWtrdaiPp51zpLBksjN5GldivIkSq0wkR3yENia/8TV1uA9NKhZbgH9KVEnI4NARzL2bNaZbD/m+Lc5FtVFAaTeuOgZefurnsG8Q0kizpjtcr+CAufaHqAtZYVMkqZeom0x8ftlKct8Fpj+j21q6FVT5EEbGmswlIMnjx5U6S5AvzjfYoztOFIoNTN0RQS4Kzomxh9JqDbWVNemsGy6VyJptcvBCn1uIc3L2IKjvHweUUaSVTdb56ISOClmTfcDFFw/2bafynPyPRTQh0jvB2a7gcUrX1mhYO4nAuWZFlgq0koKRK/IwrjE35UJIklIEnLNsJDMPCxgQ6R0gRrPTYpxXsxKB8XIToSXY3m5VAVSF1qsPIuwTVN2R+LxizF4vvcspmBToHlyxbOdsjSTov0rKktqVZpcsxEFdG53qCSrXo98SVHFSXqAbKyY2YIgJYzl82S/YoCAQTFyqEwzTjOhq+QgNd0wWIe2nppFQELeaXGxqmuJ/jqZNNlZfH7IuMC0x34Gclh6WeZa66DrfRZLfIqPyyeUv/nOoawSWHi329ZHgcSrRFSfc+xTs3/tUg10M0PUEHVXrB8jY//b9BFMAK/cUY6kKlsX8oiXrSfiEybrIdg1xLVwzDSPfGVwPvkfDvEEUI7Q2MQzbxptKioRRXpMUg48brYNuk2+7s0jqqdPSnB+kSootafM4EJWNBvs3w4oJoVuDKwHUBhVzsl3R3Dlb4NMbG9SCD69GJyvk5mt3KiCYb6oVrWlhvTO8RYf+CYNtI74q0CtEOmmW4lyUn8XB2ar/weF3iGnjf/m2SUwify072WIIgQA6CfNqqg9mcyjEjvh2S5NrkfnmUGhH2Lybvl2iy4eQUAqcXtOxkFdMLMYjKqselKVfGGGuVU78+So1gtxsLUtImdxNXELSvDide1CAKF2hJX0Zz9WqwZIF94bfJLUNpGZT4UtTWlWRFyHVW5XMlJnhcytbRAiTNvSQMuWmT/RP2aBHhqCGVPZaQMUJrFmlmlbO5k1F1tyTzFs/kIPUDuZp7sKm5JS7KqqyiCdvVTH1XkpjwJeigCMKsnC5Ekrt/a5gasFeedTJ7GpRQHXxWXysRJ5SA6qXvQsZLyiTVaMMaf8bHmCEMFigA0+kMVpshFubv5ODRvYqLg3eqcYnj4M8ZJCO4z7lcaSk4XZ+RQKsallbfzmKoDEMHZV4u4jlqwwPZV8zNK4rCcdFoOMQiELuBXgyFotEoun/5RQUBzVmFbNvQGsGzWRaNoM60ZllsVitx+tAqTZnnlxYvnrzOcp4LCBqkF1/2nuEN5ftPc/NcOZ1OD8uNRm6/1e/3gXnMb0JMiUFO2+/v594bDXT/UjtcGgEaaeSgjX5UgVYsmvEr0Eb/E24rWzSCEe3PuJY0i5p4YYI0H3w7NK7jgjxgZrBA/mjOh5Fp+ciO6da2qfIRsABcXLhHWJAcKyy3Yd3KYhuBPSu5G7hqIqXRaiCIElVGnSltVuSD8ynS7DEEEGgu72g2HbJv9Rj3XEwOznvpX0l1NeKWVJe43oFIaVk9OQGDLM8m0u7UxfnDClq/YdgmY8l0K7IOqn4PbfjiBF8Qbc1uyRyryOOgKbXEEXMxFVpC5ZcLxZl2fb6yYGC2SFiqqycFLbBJqlvc/vSWy1c0iaYZoMzcs6LA0WaGv5G0bvcXFZjo4ZXc9J47VbwwrwOpyMGg6eIMuzFCs56oLkvVE9UAOZhJzhKdY6so6UQOLnjZy6v2/HkcpEitRsvDYbW5bB2J3QsEmtXhcHfZ2ey6beRgOCzbJB2xodUbE7rWnkj6Nhgdp6o4y/SaNkUkCAmE7VQq1c+V7We3q8NGH+6LCYo5rYeQwI8baaxqpDxAjWwL1iHEDCnz3HPinGFU7EwrMi0al8tJvDp1soEtB7kMG44KKcJ0L8J+hFs9TcdGOf+WzZDoxxw0ghtKmlpB3pMXUZALZilIzwOKQ4PryTktroRby+3PkPY7bGMrmiM2MiTYRidduUSzE6qW60hBWr6aDs/SfNmvb+g8xN8hSmTgPJ0nG6lPF5myMjNNicvKpb6JBy/R0yZlJFXbG3AJwcW0gDommiQzYkQv66KXRFcdd9ETCG6mo/7wFc1noH1IuOaAQuNzCC1oVT2/Pz1igvxsNnbLRSqeJK1EiZOclQW2iVStQ0EC2LCuYpcimi1tq2gbUkbUF9iiKXZegtiY52dR/rubKqhAsp9jx0PVhqqbRrbmgz4hIq2tq2hdZPZVL/jeo43QtBbl6xZqHHHTukCS6oFzg0Km6qYRhFhae9+LDKLU90/MYoXii4jXnM0nddyoL4oFNkl11zoMJ4JVtJgE7W5nZNOOZzBX95X67FrZXesbpup2RoHTi00VBinr8lzMIgrb7sqDRKppF4/MnO1PqbqUKjSlF4fvX1WVsZ+nyrmcKF6LVIkD3j3VUF9/a6lSsZ98PHBbCSVStSwEEZAkmXHXCgyPLW1LcI6+2zo+kWr5l6huCc6ypbTrou/fo6pYpnMmuHM0CESqDRczWkSqbhqZwZFY3QuVTHXfxVAghlw5L/NijsTadz8PRabqwpQTG/FE1Uk1p+ou4rTvpSuqZUIjnqg6Eaub3s16uVmqnpaDsX1CczM0XWVM016uY6yumeqWn7zHQYMb9zDv5V+kGiZXcDS4yvhnvfyDCry1lbKfgXATn88RHRCa+02prjJM3poNb5Sq1yWN9oap4El/ycNiLVR3PPUJsG1Tn/alXdY2dJAVeB1j1TNVoglBWLex+12qIXIp3qP9/bNU7Sa8PervVmijVD0+f0AyTaTqKX4AhPcJDf6yVIk2xOdreVxGuFmpeqfKbpGYBrxuKNnIWI1XDxCGZQ4vAkMHDmiLtKzB4dejiwvGIqSAqep1ed1aqEYb4Ner6fSw8T7gopywE0ntYESwBRk0EHbTJKCVXo33Bm4qtS0IQpILs8R030sRR6O6jrG6FU1FItt7qR34l9pp5XK58u5BtVptxp2VxIwINMfj5m7uc2vdwSbZgTmNlkLhqCJEUqn+PpJbs+mcHF5mUU1Xh8NGbrAvJJOC3+8HiQLCQIckg7DXJb8skeqKh8eGOCUZ207tDwbDqtP1HxjN9G6jMWhtpSIpP2irwHHoHBHWCLQMkyM8IO9rflNuqbIsWjcS8X+CkjZdLPeKo4NgWjs7qVgSLVtdefYEYSLI5TymV6psmFNiAjdID8duBmEz3Wj0uRToppvd3oTZkU1QXRirSJTJ7chgd+hiMALJYfk9lvIrUQ872pW0ZZNup2wN2CFRnUkVnc+S3BoMD9wvTvyf4kqQCyDEJZ59DUGqhWpDazEUTe7tAEvXJDV4j5Y0Z22Bd+/7aExUC+lGP4U2CoY4v9JquDlbaL1U3y2b/PS+/XaBarya6+8p0RCMzO1kbriqRrlRqiFrx+o12F+gWm1sgTTZrTAXSzo5SmjDVAkBv5tFX5ZUm8PPJKLJcn5h4M7K+sbD/U/CS9+iGrVs8ntSPWhs7SkQb0WVVL/s7BysKQLpBjqLihTEfYcqwQ1+g2q0kUpq4uTeh+5MUGH4mcJnUYU2IdWtlKVufYPqVhSdTxHjXIrTVy2HItOzqAgW5M9RDXOp/q5d2dUC43dQgnls8J+gGlIiLcK5OURUB4J/MQb6+1RZLtUaunQq1fdlnhujap3FeaAK45N1q7fNhiBYxbQbocqylk269qthZbvh0g7Fh60I4eCijVAlmHV3MTAo7n7aHU/fQW6HfIZaeBPOhlAJdlPwDgvRskvFLZSTgl2UTazFbSDcd7xgiY2mcml3PH3p/VWH/21EgQn5qtMqhJIauLS4gbI/uTJt2ohUCTPnjqiGkoLLyM/XHDg6zXEjUiVsoHBQMQzFWml3PH3p/rYzc7cRqqSl46vMEhB1WTSJ7zo/5XATCkyqA69Y4Rbe3nddUGglnde/NiFVogOz8zbhvZyHyombZR9EqXqfSiZV0eyqo6HYp6cSkZvpqU1QJZSBwS4RVgixfrdjdEb1l6VK3NBivWifVVjSs1krVeJY9TxBCBEEsb5lNVijO3arf1ZRddHLDVC1WVFpXmHIRgbfqVb/slRtVhkGloYF6K7LJG0jVD0XguxOr1hMWcP+b+iuRnUdFtizVG3XUw4NGswKn98uzq+HqlepEpcHIRTm21bDEWe7ctZHlWRDPEvVbzv6poOLFfbXMd/iapEscfOJR6rkBVoYugaHUq5E2iTFX2tZD+xljwhu0N7SBHBszfVdFVMaqY0uvPM6Vu1O5ph2zk9ehWiBtMJtdpGsR6rEOaBZx3cUV8rbbAnshpdTeqS6cg9rIO3wm3M0lFOIzF+UKjEr94YqqwXNG6bqySytMEoukYvoSR+RqpsqenStVNmI+0WYRBhOuiaupnZTRSdK1dveNbtIyR0COcOBCmvZgE3snJf1VKz/OwnZAg44o2oqf44qRwpqXOM9slCaIUrVTS/XSZXdW9NIbbKm89wId7rZzULcKeKBqsMDBFaisbNcbSOf9uFiN8AaD0tgQ2shGm9ZnKC7joNN1kg15nXl5mLn/RZebi1U/aTo3DVVYpLvCo2IVamYaIHdKDCRqtvtayxxd40LxD+tNy0Tt7O42blDpOp2+4+wBptUVQghGpGqmxPc1nQMHHlKyoTnPMklkb82grz918XWdaLaxV2d0zZX32t733rWyec/rF8akCfVFWKjLhIwhdQGaSrJGrMvf5lQE1+BGB6On2qd7gdllbDGW2Q7aFOvcn46JTG9d5ewzs/z/Hr23VBA1wqFR6pD3QR8o3/m15p263BsAk7nx4USrbgrb8NGpwpWoJ6BacdSRQvUF/WB9PyBMo2atClAMra+QzbugbCzr1hjOZsDkgqkBWzmZnZmViNA5akP31PPssVHXXPH1MPSK2WLKU42HOY4TvBvc6SvSNXQULb9SfRtBGELNQyhRpSksB1u2PnCeIPbFnAjIXtdTqXnb5o8XfualoMRixz/vKaul3prYZAi/c9cubx74KAQFWgepMvlxuenyYLvtFAjw3TVQR4y1hpp2U0sJ5dGUjz/SGjtBg/iSb62OJZzFh6DfHasHVZ/xcBqFMgntnIGy6b175n4DG+px5t/ta/uwkXLg/c9nbu/FqrkE9oN+xzGeWq0Qt8eqVqeelqQmHXTf5Bq2PB9Ch0KORP7hiY3N0ueyOobMv4i1VBo3qUxNUaes+tylMW3rDzqn6MaUua8mr0n+P+Mul3Z2Nmo1j0ztN234PrXqLKCQYLdTh71v7BSqGfU1+MNZeS6ZY7upmWqOKB5cICPcNg1I42uN+GegBVV/TsyAloj2jEQ1o1U541YLvoMR42+fdztUB9O6mijbqcHfA23WsS/EEAgKBFALAkQtF37S1DQln4B7hEgWAgvb05g0U74cAheT0X8AmqC0Ai8EINGkmGLRjDT8JIAb6hOx4HH7z7FqevxQpgRsLBN9t/DZHm79VXnrZBujpq/nmDSzTsYYh8dyH86OA4+mw3snPfN2RsH92nQwPE/ChuagJP5xAI4pBuqh5hSc9/07n3P/YaRNGZ/Y6pW+zIaGntMgCAK+K8pYwg5/JvficdGFiYFaj1f4LEzckrVN8FP5YbC9YiZIlT3fvH7kUlgjbkM0kPU3S6xZmSNG6p2g9880+FC/w99+aoGLjR1MpNHZIaua0gPnyxqCzbo5XFKNw6MDKHkwOXJ7ZuGPzcTX5dCpMdU53HyTEhSiTLFSevZUsycXr1d5ucQMq6XG4+bj7jfecpUWViBJ3Q/OJ2l3LZgMWPzS1D6C8ILaEZ0cvPsJZXWmC5pQ/lvfA8ru2eoOGByZ1R+RdpGxrjWQSHE7e1i3NHsO6uMbRRc1LBtYkIVbs5Q+a/27JHqI4VyoUDeNMrLsV8eseG9hSLS7Venhvzjc225KuYYPWTfJpjwIgqfXs/GWwuSrcUa5aTW1SLYXu1bi9Jv4EmNu72lqwfR3zJPLGea/X/+96UP0+/NNo6o+DNV+zJNCJRjng9B+g6ie42lLylF4/OMqj2ceVXeKQrUaER9WXmqeMN8CsCmETZtnY1TOLi/qeUd1Ffs0ezgeRx4cI+9ZckWBrEf/arzcCxnnki46VDIQ9x0PXuaGeI32Nc8Ut1HyjTX0xzsOJ1O+Taiqdzc6Jzh5GWCLOZoOcz5JiZUHs2AmBW58B77EbLc3sAg0QAOFwr4/3G+5jIStEcv/0E9jimr5xffFZIbDqBCyk55cYw+1GoF9D/y+aO8eerwG7imxvFbqgMP8bmnBU/G1tOfkc3ld2x0u2VeyDHCM6e3ndH4oXP9vS1eSwh8jQpg0gsoeJqcAc1naiEIaza4pOdzPO14hhS/5YkiYwoJtFDrUJ4jJBIKIwrbpxuwyFQPuD0tf0I6JyhrZhtSYvtpc0WhgC49dpBNat4+OS4kOcdDp4ktwbXvLO57sHqUgeG+IKyNbUjZ/rQ6lwEiXRTWF6jaBkga8NHRIuIvyjqJiB/kon7u21YqxPm5/fQCz8lHF8t3RF338sgVgH5tkmlTXzLykM+DEHvWKwOqu58RgQt5lW6IEyKt5S8UhvHTwcnkMwqOeqgmGKBG6zS8Jox7+Ec3/4ynus4erD8tXi3vRwQl6i7ZY0NRxR/ZL1fNatvN69p6i9S2Wav5TDWDzeAsj8qP/7qdW8qmvDxON3JKzBnhUJQT/ML+e3psOf8woaal3Q9ULhib47ZNoYuiFFDmJiJtf2uzOmzsR/0RvMoFLXOZzrqwbCgUjuLZpz0YmO/DA5szHsdUd3T7dPusFYEeRp21bUJYhbNRHA2YW7RGhIK/C9fP9toUiI/Tu+VyebDfaikpjFirtZ+DS+X0mLw8boZrcHFUHtUvH5CzW+MeGgeIU2ghzCMKWiZUjaKeJ7NljJNN9CSA+OIFKRs1RlYofOSRc0Mxy1fnIzCGhFFjGKDclZzJiN+M/hlNwYNlDP5DuEGFpzFViyP59rRrkxrlsbX4aF7GKiBj8O96NDV7gfEZ5JE/NkTNmNw+4NkD+HW2sOuauARsFZqzit0EOc5/X2gSRl9EBfqzanXOT+AJwuObztQUP0Lo6LsejZtnzrc2x3uaJgQCvsk/cGQPQAtChA+Kepzmomc/4kZXIQBd+vrq6X9h8fbyI10MYyeEIdVGM523EPAFkCe7RpHfV6c3/gUjZAccMXWni4zBPqHwAkbuBKfMj9T1U/5W52vqd2GCpfXV7VIUquPe4PSscIMs2w31OHm4pVyeIbhJQAbbu/43m6m+zqPKHYWKzyjG8D11uw+PHRTIIeFTj8D2A5WVn1GFb0R94ZTw4Sn/MHvvM/XYw9a8B/d//Am9nQHs5Dz0fkQ5D0RScfivBh2u5Se+QA2R/ld7HD9TXwEU8aABDmoAHjhOIdn3aigrnNTwgP/X+dIeXOAXLS4R86DhDNVQz1DMepbH+QcwwXTGiL5vhGpeI2oSp77Q3c9dqgvPApLQng+b2YL2o/cbJDxh8thDY+0DJyEBGL/UNIa8Rfb5gepNcJ0Eks/AI8pVzmojZL9q2ogv/Gzg931Meg8oaKTw/BEuGzR9gQ4mUxvdIhFD8IEKftc4zKR6IFxCUvifQHzygFRZMzfd55EW291ou3kCnXyX+kf10H1nk784ML1ifPPY0+K8+McH9iHx6+vmT6nr/wHZzG7XNLGBXQAAAABJRU5ErkJggg==
+"""  # Replace with your actual base64 logo string
 
 # === HELPERS ===
 
-def encode_image(image_path: str) -> str:
-    with open(image_path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
-    return f"data:image/jpeg;base64,{b64}"
+def _upload_ready(img: Image.Image, size: int) -> bool:
+    return (
+        img.format == "JPEG"
+        and img.mode in ("RGB", "L")
+        and max(img.size) <= MAX_IMAGE_EDGE
+        and size <= PASSTHROUGH_MAX_BYTES
+        and img.getexif().get(0x0112, 1) == 1  # no EXIF rotation to bake in
+    )
+
+def encode_image(image: Union[str, bytes, BinaryIO]) -> str:
+    from PIL import Image, ImageOps
+
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            image = f.read()
+    elif not isinstance(image, bytes):
+        image = image.read()
+
+    # Image.open only parses the header, so the as-is check is cheap.
+    with Image.open(io.BytesIO(image)) as img:
+        if _upload_ready(img, len(image)):
+            view = memoryview(image)
+        else:
+            # Bake in the EXIF rotation, since re-encoding drops the tag.
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            view = buf.getbuffer()
+
+    # Encode straight from the buffer in chunks instead of materialising
+    # the raw bytes, the base64 bytes and the final string all at once.
+    uri = bytearray(b"data:image/jpeg;base64,")
+    with view:
+        for start in range(0, len(view), B64_CHUNK):
+            uri += base64.b64encode(view[start:start + B64_CHUNK])
+    return uri.decode("ascii")
 
+@functools.lru_cache(maxsize=None)
 def build_prompt() -> str:
     return (
         "As a civil engineer, I have some photos and would like to classify them into different categories before starting a project. "
@@ -25,100 +94,409 @@ def build_prompt() -> str:
         "If nothing, then just mention a statement about the image. Sound it technical and to the point."
     )
 
-def estimate_cost(prompt_text: str, response_text: str, model: str="gpt-4o") -> float:
-    enc = tiktoken.encoding_for_model(model)
-    in_tokens  = len(enc.encode(prompt_text))
-    out_tokens = len(enc.encode(response_text))
-    return round(in_tokens * 0.005/1000 + out_tokens * 0.015/1000, 6)
-
-def generate_report(image_paths: list[str], output_path: str="output_report.docx") -> tuple[float, str]:
-    doc = Document()
-    total_cost = 0.0
-
-    # === LOGO BASE64 ===
-    LOGO_BASE64 = """
-    iVBORw0KGgoAAAANSUhEUgAAAOoAAADYCAMAAADS+I/aAAABAlBMVEX///8kMl4AAADzVycAGFL39/nyRgDzVSQiMF0SJVcdLVvzVSUAHVQcLFvzSADzUyAAEU8AFFAAAEqTl6gYKVnzTxgAF1EAE08LIVVQWHjzThTw8PLExs//+vgAHlQAD0+ws8D82tL+8/BeZYEOABHn5+j+7Of9492PlKb5q5rGyNADAAn6uar7y8D0ZTz0XzL3lH34oY14fpTb3OE+SG2xsbP2gWT6wLL1elv7z8X1b0sXDhmbmp2KiYwhGyNOS1F0cnb4mIL4ppMxPWZoboehpbOtrK9hX2RCP0U1MTiVlJfT09X3i3LyOwD0akVwdYvExMVram5KR00AADtHT3EeGSPXp+InAAAc6klEQVR4nNVdCVuyTBc2UARBsBIjzH3XbFHLyjJLrcwWe776/3/lOzOgojAIpNV7P9f1VIjj3JwzZ5tFn2/DyJycbvoj/giKr7L48tud+BlcMrx09Nud+BkkaPH18Lc7sVEUX9r6b4l6aXoxkfX5sod39xnDjYlS0eLt2cPT08PLxEa7uB5kzxnxbv5nAvc588q8FuuMKqvMbPAW4UbmOOM7rF9mjQ3UX2W4jXmxegx/C9nX+QBtXxy/1tEvRYaXT0RJ4mma0VU6w8g8zUtimxFfjaL2wRNRZZ6Xxcsf7bcXHAV5uX16jKR5KAbVCrqWYGhaUt9eVJ4PqviurBikeVFlJBnYLwgwc3p4+KJKdJDJmhv/S0hk3iSeV2UGSepSpOUTfBmoyqDWRZGnGTx+T1U6GCz5iseIsXlgZuG69pT+LjKvQZqmefX1Hv4oibR0hS+LPC8iIb1ItFrXLtAifhoqzdMW7RyqtPRXffJUMqLK08GjNhYd6C0va1dB0uhnRaVVZJ9LDB3EDNHTeLNo7k6eSzVbubiaWfXfRv1cYuQ7zPakEoQBqV8Hy4OFCQOYZtDLiCqyS3VgeI5eKE1/mePkrl2/A2FPh3BdVCVJEo//gkmuS6IUBHsjaZK9kGaGBn4VsXzf4BrifKhTbU/1ExRYH84ziDIywSpT1/5sM0EwaTIY6983UydMUBZVGHyyJp57WR+PYHymv17p9IGijEZxRgQtRy8g7ovmJ/OqSnzwqKI/rRIDDV/VKyq//Eh+FCU8gI5k8b7oK4J50YRZBzp6RjMV4ky8s9eQWUIP4UjS75gjUX+D8T71tUcSL13AzxPZylL/FC5fRfSjJCGGpaupe8gyU7s79zbnkm5wRex0wOzAYFRPKsBUs1OLAF6aT/K1RbgP+2h1eunHUcr4VF4TCPSkfsRAKBQ8xi8dB3l9XBWnrE9kGkc/GZGX8RhN0CgiUiFU0J7BIhKiJkrUli51MGgWN/4AMufMEXRb1V3iCwOGg56GB8BLuqqfgKwTSHb4EsPgEDEDAa7mLhMoBGYq4GiNwjrUdRTCKqwxGXBXEr5yLi1GVe2f0uY2SkV58V77PAj4mMrMkUAUi8JAbEFpVX1FAr5s1y9xRw0dLF5CnI9M8/xaljnGVqyt6n4Y7Jo+7tEVI7srqb4RZkVTjEaD95wanwzDIztbnMVGbzIKmNAgva+0M3aPHyJFY/Z+IQfF49PKCTLnWPhvU6HDINdVWseRxJyvX7CJU+Z12SKAbZ2NHYhskNOEganrWPaCYcRz28ykfYFazAIVo685FGU+KKvoSWkMVV4f/xdTS32k8wODwHybmQnn8OinJrU9NQ0QCKk6GbCXyIqeo0t6v7OrQptzlZHf3kSJ5hcig+ILA6FRENQftw3GXJMuBJI8kwX29aloVd4yoPwmsuDFReQRDlWUdmljBEbRNKKDuICXL45lOqgyVw6bfAUDLEFmIDFLws8evhwdX1Sy+ifrQ/VcQpb7/PjyqOSbvbKJkAJnXGDvGRigfJDBkivi54xfTiCXIUmvl/VDx7Fb5kVkRFFkrux9pRTEhOr62ChevOpOGD5e16CT9ZqnIKjmfYIBRwjCoLXoFKz/1C6VQNqi6vYji5lLW5OFAGNDLkGMBZ+PP+uifapZCIgssaMuHavM+TqDYxSzBF8k8bR+j6oH2OpnpokZINGubKbwBREwL0oqCoPRnxmwUVlMrC7izKcCkQsvvq4z6YFwnZewCcyoU+PzZg5f1486g/QoKF7hJ3k/05xDNSj7EhfwJCTmbq0pD0Qt4Fzwx0GkoDkAlIg5qmgHCs3qQXq38f6e+9SRe39/3x0eVJuFwIo3l84hqAqa/HpFlc5LMphG5nzdkfELKndpTy84TWFkmaFtVSferO7mPlvbEb+QVLhoNBoOh0MA+AF/cIog+Ldj/c/cbrUZJ7eSKFp8CDgAHkWPb+uPi7NoZGrqikJ3/AH3F+TPiVeH7629mMCFQ+yWLdhQmBP8e/3B7oEN32WAUQSu0kbKMBVVr4Th4MhWacbpQV8QuGjInuMS4zCX3O4P0mNHvUEDSmLWWlLMHp5WdFq0pOdfEP6qxDfE0wMlpkTZFaIk8lX8wiBdWNkvyO2ki7Xa/IqI5h40v3WJVPjlso4M75317eNha1uJeiJpQFSJ9XcPbPt1rxoDytLl9y0TqhqpQVoO4lYvUEwkQmSkWtrdaiPp51zpLBksjN5GldivIkSq0wkR3yENia/8TV1uA9NKhZbgH9KVEnI4NARzL2bNaZbD/m+Lc5FtVFAaTeuOgZefurnsG8Q0kizpjtcr+CAufaHqAtZYVMkqZeom0x8ftlKct8Fpj+j21q6FVT5EEbGmswlIMnjx5U6S5AvzjfYoztOFIoNTN0RQS4Kzomxh9JqDbWVNemsGy6VyJptcvBCn1uIc3L2IKjvHweUUaSVTdb56ISOClmTfcDFFw/2bafynPyPRTQh0jvB2a7gcUrX1mhYO4nAuWZFlgq0koKRK/IwrjE35UJIklIEnLNsJDMPCxgQ6R0gRrPTYpxXsxKB8XIToSXY3m5VAVSF1qsPIuwTVN2R+LxizF4vvcspmBToHlyxbOdsjSTov0rKktqVZpcsxEFdG53qCSrXo98SVHFSXqAbKyY2YIgJYzl82S/YoCAQTFyqEwzTjOhq+QgNd0wWIe2nppFQELeaXGxqmuJ/jqZNNlZfH7IuMC0x34Gclh6WeZa66DrfRZLfIqPyyeUv/nOoawSWHi329ZHgcSrRFSfc+xTs3/tUg10M0PUEHVXrB8jY//b9BFMAK/cUY6kKlsX8oiXrSfiEybrIdg1xLVwzDSPfGVwPvkfDvEEUI7Q2MQzbxptKioRRXpMUg48brYNuk2+7s0jqqdPSnB+kSootafM4EJWNBvs3w4oJoVuDKwHUBhVzsl3R3Dlb4NMbG9SCD69GJyvk5mt3KiCYb6oVrWlhvTO8RYf+CYNtI74q0CtEOmmW4lyUn8XB2ar/weF3iGnjf/m2SUwify072WIIgQA6CfNqqg9mcyjEjvh2S5NrkfnmUGhH2Lybvl2iy4eQUAqcXtOxkFdMLMYjKqselKVfGGGuVU78+So1gtxsLUtImdxNXELSvDide1CAKF2hJX0Zz9WqwZIF94bfJLUNpGZT4UtTWlWRFyHVW5XMlJnhcytbRAiTNvSQMuWmT/RP2aBHhqCGVPZaQMUJrFmlmlbO5k1F1tyTzFs/kIPUDuZp7sKm5JS7KqqyiCdvVTH1XkpjwJeigCMKsnC5Ekrt/a5gasFeedTJ7GpRQHXxWXysRJ5SA6qXvQsZLyiTVaMMaf8bHmCEMFigA0+kMVpshFubv5ODRvYqLg3eqcYnj4M8ZJCO4z7lcaSk4XZ+RQKsallbfzmKoDEMHZV4u4jlqwwPZV8zNK4rCcdFoOMQiELuBXgyFotEoun/5RQUBzVmFbNvQGsGzWRaNoM60ZllsVitx+tAqTZnnlxYvnrzOcp4LCBqkF1/2nuEN5ftPc/NcOZ1OD8uNRm6/1e/3gXnMb0JMiUFO2+/v594bDXT/UjtcGgEaaeSgjX5UgVYsmvEr0Eb/E24rWzSCEe3PuJY0i5p4YYI0H3w7NK7jgjxgZrBA/mjOh5Fp+ciO6da2qfIRsABcXLhHWJAcKyy3Yd3KYhuBPSu5G7hqIqXRaiCIElVGnSltVuSD8ynS7DEEEGgu72g2HbJv9Rj3XEwOznvpX0l1NeKWVJe43oFIaVk9OQGDLM8m0u7UxfnDClq/YdgmY8l0K7IOqn4PbfjiBF8Qbc1uyRyryOOgKbXEEXMxFVpC5ZcLxZl2fb6yYGC2SFiqqycFLbBJqlvc/vSWy1c0iaYZoMzcs6LA0WaGv5G0bvcXFZjo4ZXc9J47VbwwrwOpyMGg6eIMuzFCs56oLkvVE9UAOZhJzhKdY6so6UQOLnjZy6v2/HkcpEitRsvDYbW5bB2J3QsEmtXhcHfZ2ey6beRgOCzbJB2xodUbE7rWnkj6Nhgdp6o4y/SaNkUkCAmE7VQq1c+V7We3q8NGH+6LCYo5rYeQwI8baaxqpDxAjWwL1iHEDCnz3HPinGFU7EwrMi0al8tJvDp1soEtB7kMG44KKcJ0L8J+hFs9TcdGOf+WzZDoxxw0ghtKmlpB3pMXUZALZilIzwOKQ4PryTktroRby+3PkPY7bGMrmiM2MiTYRidduUSzE6qW60hBWr6aDs/SfNmvb+g8xN8hSmTgPJ0nG6lPF5myMjNNicvKpb6JBy/R0yZlJFXbG3AJwcW0gDommiQzYkQv66KXRFcdd9ETCG6mo/7wFc1noH1IuOaAQuNzCC1oVT2/Pz1igvxsNnbLRSqeJK1EiZOclQW2iVStQ0EC2LCuYpcimi1tq2gbUkbUF9iiKXZegtiY52dR/rubKqhAsp9jx0PVhqqbRrbmgz4hIq2tq2hdZPZVL/jeo43QtBbl6xZqHHHTukCS6oFzg0Km6qYRhFhae9+LDKLU90/MYoXii4jXnM0nddyoL4oFNkl11zoMJ4JVtJgE7W5nZNOOZzBX95X67FrZXesbpup2RoHTi00VBinr8lzMIgrb7sqDRKppF4/MnO1PqbqUKjSlF4fvX1WVsZ+nyrmcKF6LVIkD3j3VUF9/a6lSsZ98PHBbCSVStSwEEZAkmXHXCgyPLW1LcI6+2zo+kWr5l6huCc6ypbTrou/fo6pYpnMmuHM0CESqDRczWkSqbhqZwZFY3QuVTHXfxVAghlw5L/NijsTadz8PRabqwpQTG/FE1Uk1p+ou4rTvpSuqZUIjnqg6Eaub3s16uVmqnpaDsX1CczM0XWVM016uY6yumeqWn7zHQYMb9zDv5V+kGiZXcDS4yvhnvfyDCry1lbKfgXATn88RHRCa+02prjJM3poNb5Sq1yWN9oap4El/ycNiLVR3PPUJsG1Tn/alXdY2dJAVeB1j1TNVoglBWLex+12qIXIp3qP9/bNU7Sa8PervVmijVD0+f0AyTaTqKX4AhPcJDf6yVIk2xOdreVxGuFmpeqfKbpGYBrxuKNnIWI1XDxCGZQ4vAkMHDmiLtKzB4dejiwvGIqSAqep1ed1aqEYb4Ner6fSw8T7gopywE0ntYESwBRk0EHbTJKCVXo33Bm4qtS0IQpILs8R030sRR6O6jrG6FU1FItt7qR34l9pp5XK58u5BtVptxp2VxIwINMfj5m7uc2vdwSbZgTmNlkLhqCJEUqn+PpJbs+mcHF5mUU1Xh8NGbrAvJJOC3+8HiQLCQIckg7DXJb8skeqKh8eGOCUZ207tDwbDqtP1HxjN9G6jMWhtpSIpP2irwHHoHBHWCLQMkyM8IO9rflNuqbIsWjcS8X+CkjZdLPeKo4NgWjs7qVgSLVtdefYEYSLI5TymV6psmFNiAjdID8duBmEz3Wj0uRToppvd3oTZkU1QXRirSJTJ7chgd+hiMALJYfk9lvIrUQ872pW0ZZNup2wN2CFRnUkVnc+S3BoMD9wvTvyf4kqQCyDEJZ59DUGqhWpDazEUTe7tAEvXJDV4j5Y0Z22Bd+/7aExUC+lGP4U2CoY4v9JquDlbaL1U3y2b/PS+/XaBarya6+8p0RCMzO1kbriqRrlRqiFrx+o12F+gWm1sgTTZrTAXSzo5SmjDVAkBv5tFX5ZUm8PPJKLJcn5h4M7K+sbD/U/CS9+iGrVs8ntSPWhs7SkQb0WVVL/s7BysKQLpBjqLihTEfYcqwQ1+g2q0kUpq4uTeh+5MUGH4mcJnUYU2IdWtlKVufYPqVhSdTxHjXIrTVy2HItOzqAgW5M9RDXOp/q5d2dUC43dQgnls8J+gGlIiLcK5OURUB4J/MQb6+1RZLtUaunQq1fdlnhujap3FeaAK45N1q7fNhiBYxbQbocqylk269qthZbvh0g7Fh60I4eCijVAlmHV3MTAo7n7aHU/fQW6HfIZaeBPOhlAJdlPwDgvRskvFLZSTgl2UTazFbSDcd7xgiY2mcml3PH3p/VWH/21EgQn5qtMqhJIauLS4gbI/uTJt2ohUCTPnjqiGkoLLyM/XHDg6zXEjUiVsoHBQMQzFWml3PH3p/rYzc7cRqqSl46vMEhB1WTSJ7zo/5XATCkyqA69Y4Rbe3nddUGglnde/NiFVogOz8zbhvZyHyombZR9EqXqfSiZV0eyqo6HYp6cSkZvpqU1QJZSBwS4RVgixfrdjdEb1l6VK3NBivWifVVjSs1krVeJY9TxBCBEEsb5lNVijO3arf1ZRddHLDVC1WVFpXmHIRgbfqVb/slRtVhkGloYF6K7LJG0jVD0XguxOr1hMWcP+b+iuRnUdFtizVG3XUw4NGswKn98uzq+HqlepEpcHIRTm21bDEWe7ctZHlWRDPEvVbzv6poOLFfbXMd/iapEscfOJR6rkBVoYugaHUq5E2iTFX2tZD+xljwhu0N7SBHBszfVdFVMaqY0uvPM6Vu1O5ph2zk9ehWiBtMJtdpGsR6rEOaBZx3cUV8rbbAnshpdTeqS6cg9rIO3wm3M0lFOIzF+UKjEr94YqqwXNG6bqySytMEoukYvoSR+RqpsqenStVNmI+0WYRBhOuiaupnZTRSdK1dveNbtIyR0COcOBCmvZgE3snJf1VKz/OwnZAg44o2oqf44qRwpqXOM9slCaIUrVTS/XSZXdW9NIbbKm89wId7rZzULcKeKBqsMDBFaisbNcbSOf9uFiN8AaD0tgQ2shGm9ZnKC7joNN1kg15nXl5mLn/RZebi1U/aTo3DVVYpLvCo2IVamYaIHdKDCRqtvtayxxd40LxD+tNy0Tt7O42blDpOp2+4+wBptUVQghGpGqmxPc1nQMHHlKyoTnPMklkb82grz918XWdaLaxV2d0zZX32t733rWyec/rF8akCfVFWKjLhIwhdQGaSrJGrMvf5lQE1+BGB6On2qd7gdllbDGW2Q7aFOvcn46JTG9d5ewzs/z/Hr23VBA1wqFR6pD3QR8o3/m15p263BsAk7nx4USrbgrb8NGpwpWoJ6BacdSRQvUF/WB9PyBMo2atClAMra+QzbugbCzr1hjOZsDkgqkBWzmZnZmViNA5akP31PPssVHXXPH1MPSK2WLKU42HOY4TvBvc6SvSNXQULb9SfRtBGELNQyhRpSksB1u2PnCeIPbFnAjIXtdTqXnb5o8XfualoMRixz/vKaul3prYZAi/c9cubx74KAQFWgepMvlxuenyYLvtFAjw3TVQR4y1hpp2U0sJ5dGUjz/SGjtBg/iSb62OJZzFh6DfHasHVZ/xcBqFMgntnIGy6b175n4DG+px5t/ta/uwkXLg/c9nbu/FqrkE9oN+xzGeWq0Qt8eqVqeelqQmHXTf5Bq2PB9Ch0KORP7hiY3N0ueyOobMv4i1VBo3qUxNUaes+tylMW3rDzqn6MaUua8mr0n+P+Mul3Z2Nmo1j0ztN234PrXqLKCQYLdTh71v7BSqGfU1+MNZeS6ZY7upmWqOKB5cICPcNg1I42uN+GegBVV/TsyAloj2jEQ1o1U541YLvoMR42+fdztUB9O6mijbqcHfA23WsS/EEAgKBFALAkQtF37S1DQln4B7hEgWAgvb05g0U74cAheT0X8AmqC0Ai8EINGkmGLRjDT8JIAb6hOx4HH7z7FqevxQpgRsLBN9t/DZHm79VXnrZBujpq/nmDSzTsYYh8dyH86OA4+mw3snPfN2RsH92nQwPE/ChuagJP5xAI4pBuqh5hSc9/07n3P/YaRNGZ/Y6pW+zIaGntMgCAK+K8pYwg5/JvficdGFiYFaj1f4LEzckrVN8FP5YbC9YiZIlT3fvH7kUlgjbkM0kPU3S6xZmSNG6p2g9880+FC/w99+aoGLjR1MpNHZIaua0gPnyxqCzbo5XFKNw6MDKHkwOXJ7ZuGPzcTX5dCpMdU53HyTEhSiTLFSevZUsycXr1d5ucQMq6XG4+bj7jfecpUWViBJ3Q/OJ2l3LZgMWPzS1D6C8ILaEZ0cvPsJZXWmC5pQ/lvfA8ru2eoOGByZ1R+RdpGxrjWQSHE7e1i3NHsO6uMbRRc1LBtYkIVbs5Q+a/27JHqI4VyoUDeNMrLsV8eseG9hSLS7Venhvzjc225KuYYPWTfJpjwIgqfXs/GWwuSrcUa5aTW1SLYXu1bi9Jv4EmNu72lqwfR3zJPLGea/X/+96UP0+/NNo6o+DNV+zJNCJRjng9B+g6ie42lLylF4/OMqj2ceVXeKQrUaER9WXmqeMN8CsCmETZtnY1TOLi/qeUd1Ffs0ezgeRx4cI+9ZckWBrEf/arzcCxnnki46VDIQ9x0PXuaGeI32Nc8Ut1HyjTX0xzsOJ1O+Taiqdzc6Jzh5GWCLOZoOcz5JiZUHs2AmBW58B77EbLc3sAg0QAOFwr4/3G+5jIStEcv/0E9jimr5xffFZIbDqBCyk55cYw+1GoF9D/y+aO8eerwG7imxvFbqgMP8bmnBU/G1tOfkc3ld2x0u2VeyDHCM6e3ndH4oXP9vS1eSwh8jQpg0gsoeJqcAc1naiEIaza4pOdzPO14hhS/5YkiYwoJtFDrUJ4jJBIKIwrbpxuwyFQPuD0tf0I6JyhrZhtSYvtpc0WhgC49dpBNat4+OS4kOcdDp4ktwbXvLO57sHqUgeG+IKyNbUjZ/rQ6lwEiXRTWF6jaBkga8NHRIuIvyjqJiB/kon7u21YqxPm5/fQCz8lHF8t3RF338sgVgH5tkmlTXzLykM+DEHvWKwOqu58RgQt5lW6IEyKt5S8UhvHTwcnkMwqOeqgmGKBG6zS8Jox7+Ec3/4ynus4erD8tXi3vRwQl6i7ZY0NRxR/ZL1fNatvN69p6i9S2Wav5TDWDzeAsj8qP/7qdW8qmvDxON3JKzBnhUJQT/ML+e3psOf8woaal3Q9ULhib47ZNoYuiFFDmJiJtf2uzOmzsR/0RvMoFLXOZzrqwbCgUjuLZpz0YmO/DA5szHsdUd3T7dPusFYEeRp21bUJYhbNRHA2YW7RGhIK/C9fP9toUiI/Tu+VyebDfaikpjFirtZ+DS+X0mLw8boZrcHFUHtUvH5CzW+MeGgeIU2ghzCMKWiZUjaKeJ7NljJNN9CSA+OIFKRs1RlYofOSRc0Mxy1fnIzCGhFFjGKDclZzJiN+M/hlNwYNlDP5DuEGFpzFViyP59rRrkxrlsbX4aF7GKiBj8O96NDV7gfEZ5JE/NkTNmNw+4NkD+HW2sOuauARsFZqzit0EOc5/X2gSRl9EBfqzanXOT+AJwuObztQUP0Lo6LsejZtnzrc2x3uaJgQCvsk/cGQPQAtChA+Kepzmomc/4kZXIQBd+vrq6X9h8fbyI10MYyeEIdVGM523EPAFkCe7RpHfV6c3/gUjZAccMXWni4zBPqHwAkbuBKfMj9T1U/5W52vqd2GCpfXV7VIUquPe4PSscIMs2w31OHm4pVyeIbhJQAbbu/43m6m+zqPKHYWKzyjG8D11uw+PHRTIIeFTj8D2A5WVn1GFb0R94ZTw4Sn/MHvvM/XYw9a8B/d//Am9nQHs5Dz0fkQ5D0RScfivBh2u5Se+QA2R/ld7HD9TXwEU8aABDmoAHjhOIdn3aigrnNTwgP/X+dIeXOAXLS4R86DhDNVQz1DMepbH+QcwwXTGiL5vhGpeI2oSp77Q3c9dqgvPApLQng+b2YL2o/cbJDxh8thDY+0DJyEBGL/UNIa8Rfb5gepNcJ0Eks/AI8pVzmojZL9q2ogv/Gzg931Meg8oaKTw/BEuGzR9gQ4mUxvdIhFD8IEKftc4zKR6IFxCUvifQHzygFRZMzfd55EW291ou3kCnXyX+kf10H1nk784ML1ifPPY0+K8+McH9iHx6+vmT6nr/wHZzG7XNLGBXQAAAABJRU5ErkJggg==
-    """  # Replace with your actual base64 logo string
-
-    logo_path = "temp_logo.png"
-    try:
-        with open(logo_path, "wb") as f:
-            f.write(base64.b64decode(LOGO_BASE64.strip()))
-    except Exception as e:
-        st.warning(f"⚠️ Failed to decode or save logo: {e}")
-        logo_path = None
+PROMPT = build_prompt()
+_PROMPT_HASH = hashlib.sha256(PROMPT.encode("utf-8")).digest()
+
+@st.cache_resource
+def _encode_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+
+@st.cache_resource
+def _comment_cache() -> diskcache.Cache:
+    return diskcache.Cache(CACHE_DIR)
+
+@st.cache_resource
+def _expected_credentials() -> tuple[bytes, bytes]:
+    auth = st.secrets["auth"]
+    return auth["username"].encode("utf-8"), hashlib.sha256(auth["password"].encode("utf-8")).digest()
+
+def token_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return round(prompt_tokens * 0.005/1000 + completion_tokens * 0.015/1000, 6)
+
+# tiktoken is only a fallback for responses that come back without usage.
+@st.cache_resource
+def _encoder():
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4o")
+
+@functools.lru_cache(maxsize=None)
+def _prompt_tokens() -> int:
+    return len(_encoder().encode(PROMPT))
+
+def estimate_cost(response_text: str) -> float:
+    out_tokens = len(_encoder().encode(response_text))
+    return token_cost(_prompt_tokens(), out_tokens)
+
+def _chat_body(data_uri: str) -> dict:
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": PROMPT},
+                    {"type": "image_url", "image_url": {"url": data_uri, "detail": IMAGE_DETAIL}},
+                ],
+            }
+        ],
+        "max_tokens": 200,
+    }
+
+def _tidy(text: str) -> str:
+    # Uppercase only the first letter; str.capitalize() would lowercase acronyms like PVC or ASTM.
+    s = text.strip()
+    if not s:
+        return "."
+    s = s[0].upper() + s[1:]
+    return s if s.endswith(".") else s + "."
+
+def _warn_retry(retry_state) -> None:
+    error = type(retry_state.outcome.exception()).__name__
+    st.warning(
+        f"⚠️ {error}. Retrying in {retry_state.next_action.sleep:.0f} sec... "
+        f"(Attempt {retry_state.attempt_number}/{MAX_ATTEMPTS})"
+    )
+
+def _is_transient(exc: BaseException) -> bool:
+    from openai import APIConnectionError, APITimeoutError, RateLimitError
+    return isinstance(exc, (RateLimitError, APITimeoutError, APIConnectionError))
+
+# Only transient errors are retried; anything else surfaces immediately.
+@retry(
+    retry=retry_if_exception(_is_transient),
+    wait=wait_exponential_jitter(1, 30),
+    stop=stop_after_attempt(MAX_ATTEMPTS),
+    before_sleep=_warn_retry,
+    reraise=True,
+)
+async def _call(aclient: AsyncOpenAI, data_uri: str):
+    return await aclient.chat.completions.create(**_chat_body(data_uri))
+
+def _async_client(max_retries: int=0) -> AsyncOpenAI:
+    import httpx
+    from openai import AsyncOpenAI
+
+    # Keep-alive HTTP/2 pool sized to the fan-out, so concurrent calls reuse
+    # TLS connections. Built per run: it is tied to the event loop asyncio.run creates.
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONCURRENT_REQUESTS,
+            max_keepalive_connections=MAX_CONCURRENT_REQUESTS,
+        ),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+    # SDK retries are off by default; _call does its own.
+    return AsyncOpenAI(api_key=st.secrets["api"]["key"], http_client=http_client, max_retries=max_retries)
+
+async def _analyze(
+    sem: asyncio.Semaphore,
+    pool: ThreadPoolExecutor,
+    aclient: AsyncOpenAI,
+    data: bytes,
+) -> tuple[str, float]:
+    # Encode on the pool before queueing for a network slot, so later images
+    # are encoded while earlier requests are still in flight. The pool caps CPU
+    # use; the semaphore caps only the API calls.
+    loop = asyncio.get_running_loop()
+    data_uri = await loop.run_in_executor(pool, encode_image, data)
+    async with sem:
+        resp = await _call(aclient, data_uri)
+
+    comment = _tidy(resp.choices[0].message.content)
+    u = resp.usage
+    cost = token_cost(u.prompt_tokens, u.completion_tokens) if u else estimate_cost(comment)
+    return comment, cost
+
+async def _analyze_all(images: list[tuple[str, bytes]]) -> list:
+    # Fire all image requests at once; the semaphore caps how many are in flight.
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    pool = _encode_pool()
+    async with _async_client() as aclient:
+        return await asyncio.gather(
+            *(_analyze(sem, pool, aclient, data) for _, data in images),
+            return_exceptions=True,
+        )
+
+def _batch_key(digest: bytes) -> tuple:
+    return ("batch", digest, _PROMPT_HASH)
+
+async def _submit_batch(aclient: AsyncOpenAI, lines: list[str]) -> str:
+    batch_file = await aclient.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await aclient.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+def _batch_result(item: dict) -> tuple[str, float]:
+    response = item.get("response") or {}
+    if item.get("error") or response.get("status_code") != 200:
+        raise RuntimeError(item.get("error") or response.get("body"))
+    body = response["body"]
+    message = body["choices"][0]["message"]
+    # Refusals and content-filter hits come back with no content.
+    if message.get("content") is None:
+        raise RuntimeError(message.get("refusal") or "model returned no content")
+    comment = _tidy(message["content"])
+    u = body.get("usage")
+    cost = token_cost(u["prompt_tokens"], u["completion_tokens"]) if u else estimate_cost(comment)
+    return comment, cost * BATCH_DISCOUNT
+
+async def _collect_batch(aclient: AsyncOpenAI, batch, digests: list[bytes]) -> dict:
+    results: dict = dict.fromkeys(digests, RuntimeError(f"no result returned (batch {batch.status})"))
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await aclient.files.content(file_id)
+        for line in content.text.splitlines():
+            item = json.loads(line)
+            digest = bytes.fromhex(item["custom_id"])
+            # A bad line only fails its own image, as in live mode.
+            try:
+                results[digest] = _batch_result(item)
+            except Exception as exc:
+                results[digest] = exc
+    return results
+
+async def _analyze_batch(pending: dict[bytes, tuple[str, bytes]]) -> list:
+    from openai import NotFoundError
+
+    comment_cache = _comment_cache()
+    results: dict = {}
+
+    # Sub-batches are recorded in the comment cache as soon as they are
+    # submitted. A rerun or closed tab interrupts the script while it polls,
+    # so the next run picks those jobs up again instead of paying twice.
+    jobs: dict[str, list[bytes]] = {}
+    to_submit: list[bytes] = []
+    for digest in pending:
+        batch_id = comment_cache.get(_batch_key(digest))
+        if batch_id is None:
+            to_submit.append(digest)
+        else:
+            jobs.setdefault(batch_id, []).append(digest)
+
+    # Images Pillow can't decode fail on their own and stay out of the JSONL.
+    pool = _encode_pool()
+    futures = {digest: pool.submit(encode_image, pending[digest][1]) for digest in to_submit}
+    lines: list[tuple[bytes, str]] = []
+    for digest, future in futures.items():
+        try:
+            data_uri = future.result()
+        except Exception as exc:
+            results[digest] = exc
+            continue
+        lines.append((digest, json.dumps({
+            "custom_id": digest.hex(),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _chat_body(data_uri),
+        })))
+
+    # Large jobs are split into sub-batches that run side by side, keeping
+    # each one well under the per-batch token limits.
+    starts = range(0, len(lines), BATCH_CHUNK_SIZE)
+    chunks = [lines[i:i + BATCH_CHUNK_SIZE] for i in starts]
+
+    # Batch calls don't go through _call, so let the SDK retry them.
+    async with _async_client(max_retries=2) as aclient:
+        submitted = await asyncio.gather(
+            *(_submit_batch(aclient, [line for _, line in chunk]) for chunk in chunks),
+            return_exceptions=True,
+        )
+        for chunk, outcome in zip(chunks, submitted):
+            digests = [digest for digest, _ in chunk]
+            if isinstance(outcome, BaseException):
+                results.update(dict.fromkeys(digests, outcome))
+                continue
+            jobs[outcome] = digests
+            for digest in digests:
+                comment_cache.set(_batch_key(digest), outcome, expire=BATCH_RESUME_TTL)
+
+        total = sum(len(digests) for digests in jobs.values())
+        done = dict.fromkeys(jobs, 0)
+        progress = st.progress(0.0, text=f"Waiting on {len(jobs)} batch job(s)...")
+        delay = 5
+        while jobs:
+            polled = await asyncio.gather(
+                *(aclient.batches.retrieve(batch_id) for batch_id in jobs),
+                return_exceptions=True,
+            )
+            for batch_id, batch in zip(list(jobs), polled):
+                if isinstance(batch, NotFoundError):
+                    # A remembered job that no longer exists; forget it so the next run resubmits.
+                    digests = jobs.pop(batch_id)
+                    for digest in digests:
+                        comment_cache.delete(_batch_key(digest))
+                        results[digest] = batch
+                    done[batch_id] = len(digests)
+                    continue
+                if isinstance(batch, BaseException):
+                    continue  # transient; poll again next round
+                if batch.request_counts:
+                    done[batch_id] = batch.request_counts.completed + batch.request_counts.failed
+                if batch.status not in ("completed", "failed", "expired", "cancelled"):
+                    continue
+
+                digests = jobs.pop(batch_id)
+                try:
+                    collected = await _collect_batch(aclient, batch, digests)
+                except Exception as exc:
+                    # Keep the job remembered so the next run retries the download.
+                    results.update(dict.fromkeys(digests, exc))
+                    continue
+                # Cache this sub-batch's comments now rather than after every job is done.
+                for digest, result in collected.items():
+                    if not isinstance(result, BaseException):
+                        comment_cache[(digest, _PROMPT_HASH)] = result[0]
+                    comment_cache.delete(_batch_key(digest))
+                results.update(collected)
+                done[batch_id] = len(digests)
+
+            progress.progress(
+                min(sum(done.values()) / total, 1.0) if total else 1.0,
+                text=f"Batch jobs: {sum(done.values())}/{total} images processed",
+            )
+            if jobs:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+        progress.empty()
+
+    return [results[digest] for digest in pending]
+
+# Raw <w:p> markup for the text-only paragraphs of a report, so they can be
+# appended to the body directly instead of going through the Paragraph API.
+_W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+_CENTERED_P = (
+    f'<w:p {_W_NS}><w:pPr><w:jc w:val="center"/></w:pPr>'
+    '<w:r>{content}</w:r></w:p>'
+)
+_EMPTY_P = f'<w:p {_W_NS}/>'
+_PAGE_BREAK_P = f'<w:p {_W_NS}><w:r><w:br w:type="page"/></w:r></w:p>'
+
+_RUN_BREAK_RE = re.compile(r"(\t|\r\n|\r|\n)")
+
+def _run_content(text: str) -> str:
+    # Same mapping as python-docx's Run.text: tabs become <w:tab/> and line
+    # breaks <w:br/>; a raw newline inside <w:t> would render as a space.
+    parts = []
+    for piece in _RUN_BREAK_RE.split(text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r\n", "\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            parts.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return "".join(parts)
+
+def _append_p(body, xml: str) -> None:
+    from docx.oxml import parse_xml
+
+    # Paragraphs must stay ahead of the trailing section properties.
+    body.sectPr.addprevious(parse_xml(xml))
+
+@st.cache_resource
+def _report_template() -> bytes:
+    from docx import Document
+    from docx.shared import Cm
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
+    # Empty report with the header already built; every report starts from a copy.
+    tmpl = Document()
 
     # === Add logo to header (repeats on every page) ===
-    if logo_path and os.path.exists(logo_path):
-        section = doc.sections[0]
-        header = section.header
-        header.is_linked_to_previous = False
-        p = header.paragraphs[0]
-        p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        run = p.add_run()
-        run.add_picture(logo_path, width=Cm(2), height=Cm(2))
+    section = tmpl.sections[0]
+    header = section.header
+    header.is_linked_to_previous = False
+    p = header.paragraphs[0]
+    p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    run = p.add_run()
+    logo = base64.b64decode("".join(LOGO_BASE64.split()))
+    run.add_picture(io.BytesIO(logo), width=Cm(2), height=Cm(2))
+
+    buf = io.BytesIO()
+    tmpl.save(buf)
+    return buf.getvalue()
+
+def generate_report(
+    images: list[tuple[str, bytes]],
+    batch_mode: bool=False,
+    force_refresh: bool=False,
+) -> tuple[float, bytes]:
+    from docx import Document
+    from docx.shared import Cm
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
+    # Identical uploads share one API call; duplicates reuse its comment for free.
+    digests = [hashlib.blake2b(data, digest_size=16).digest() for _, data in images]
+    unique: dict[bytes, tuple[str, bytes]] = {}
+    for digest, image in zip(digests, images):
+        unique.setdefault(digest, image)
+
+    # Comments from earlier runs are reused unless a refresh is forced;
+    # fresh comments are always written back.
+    comment_cache = _comment_cache()
+    known: dict[bytes, tuple[str, float]] = {}
+    pending: dict[bytes, tuple[str, bytes]] = {}
+    for digest, image in unique.items():
+        comment = None if force_refresh else comment_cache.get((digest, _PROMPT_HASH))
+        if comment is None:
+            pending[digest] = image
+        else:
+            known[digest] = (comment, 0.0)
+
+    fresh: list = []
+    if pending and batch_mode:
+        # Caches each sub-batch's comments itself, as soon as that job finishes.
+        fresh = asyncio.run(_analyze_batch(pending))
+    elif pending:
+        fresh = asyncio.run(_analyze_all(list(pending.values())))
+        for digest, result in zip(pending, fresh):
+            if not isinstance(result, BaseException):
+                comment_cache[(digest, _PROMPT_HASH)] = result[0]
+    known.update(zip(pending, fresh))
+    results = [known[digest] for digest in digests]
+
+    doc = Document(io.BytesIO(_report_template()))
+    total_cost = sum(r[1] for r in fresh if not isinstance(r, BaseException))
 
     # === Track images per page ===
     images_on_page = 0
 
-    for idx, img_path in enumerate(image_paths, start=1):
-        data_uri = encode_image(img_path)
-        retries = 3
-        delay = 5
-        success = False
+    body = doc.element.body
+    total = len(images)
 
-        for attempt in range(retries):
-            try:
-                resp = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": build_prompt()},
-                                {"type": "image_url", "image_url": {"url": data_uri}},
-                            ],
-                        }
-                    ],
-                    max_tokens=200,
-                )
-                comment = resp.choices[0].message.content.strip().capitalize()
-                if not comment.endswith("."):
-                    comment += "."
-                total_cost += estimate_cost(build_prompt(), comment)
-                success = True
-                break
-            except RateLimitError:
-                st.warning(f"⚠️ Rate limit hit. Retrying in {delay} sec... (Attempt {attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
-            except Exception as e:
-                comment = f"⚠️ Error analyzing image: {e}"
-                break
-
-        if not success:
-            comment = comment if 'comment' in locals() else "⚠️ Could not analyze image after retries."
+    # python-docx is not thread-safe, so assembly stays sequential.
+    for idx, ((_, data), result) in enumerate(zip(images, results), start=1):
+        if isinstance(result, BaseException):
+            comment = f"⚠️ Error analyzing image: {result}"
+        else:
+            comment, _ = result
 
         # === Add image & comment ===
-        p_num = doc.add_paragraph(f"Image No.: {idx}")
-        p_num.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        _append_p(body, _CENTERED_P.format(content=_run_content(f"Image No.: {idx}")))
 
+        # The picture goes through the high-level API so its image part gets registered.
         p_img = doc.add_paragraph()
         run = p_img.add_run()
-        run.add_picture(img_path, width=Cm(15), height=Cm(7.5))
+        run.add_picture(io.BytesIO(data), width=Cm(15), height=Cm(7.5))
         p_img.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-        p_txt = doc.add_paragraph(f"Assessment: {comment}")
-        p_txt.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        doc.add_paragraph("")
+        _append_p(body, _CENTERED_P.format(content=_run_content(f"Assessment: {comment}")))
+        _append_p(body, _EMPTY_P)
 
         images_on_page += 1
-        if images_on_page == 2:
-            doc.add_page_break()
+        if images_on_page == 2 and idx != total:
+            _append_p(body, _PAGE_BREAK_P)
             images_on_page = 0
 
-    doc.save(output_path)
-    return total_cost, output_path
+    doc.save(buf := io.BytesIO())
+    return total_cost, buf.getvalue()
 
 # === STREAMLIT PAGES ===
 
@@ -128,8 +506,12 @@ def login_page():
     pwd = st.text_input("Password", type="password")
 
     if st.button("Log in"):
-        if (user == st.secrets["auth"]["username"]
-         and pwd == st.secrets["auth"]["password"]):
+        # Constant-time checks; `&` so both always run.
+        expected_user, expected_pwd_hash = _expected_credentials()
+        ok = hmac.compare_digest(user.encode("utf-8"), expected_user) & hmac.compare_digest(
+            hashlib.sha256(pwd.encode("utf-8")).digest(), expected_pwd_hash
+        )
+        if ok:
             st.session_state.logged_in = True
             st.success("Login successful! Please upload images.")
         else:
@@ -146,30 +528,37 @@ def image_analysis_page():
         st.info("Please upload one or more images.")
         return
 
-    os.makedirs("temp_images", exist_ok=True)
-    image_paths: list[str] = []
+    images: list[tuple[str, bytes]] = []
     for f in uploaded:
-        ext = os.path.splitext(f.name)[1].lower()
-        if ext not in (".jpg", ".jpeg", ".png"):
+        if not _EXT_RE.search(f.name):
             st.error(f"Invalid extension on `{f.name}` – only .jpg/.jpeg/.png allowed.")
             continue
-        path = os.path.join("temp_images", f.name)
-        with open(path, "wb") as out:
-            out.write(f.getbuffer())
-        image_paths.append(path)
+        images.append((f.name, f.getbuffer().tobytes()))
 
-    if not image_paths:
+    if not images:
         st.warning("No valid images to process.")
         return
 
-    st.write("✅ Saved images:", image_paths)
+    st.write("✅ Loaded images:", [name for name, _ in images])
+    batch_mode = st.toggle(
+        "Batch mode",
+        help="Half the API cost, but the report can take minutes (up to 24h) to come back.",
+    )
+    force_refresh = st.checkbox(
+        "Force refresh",
+        help="Re-analyze every image instead of reusing comments from earlier runs.",
+    )
     if st.button("Generate Report"):
-        cost, docx_file = generate_report(image_paths)
+        cost, docx_bytes = generate_report(images, batch_mode=batch_mode, force_refresh=force_refresh)
         st.success("Report generated!")
-        st.write(f"• File: `{docx_file}`")
+        st.write(f"• File: `{REPORT_FILENAME}`")
         st.write(f"• Estimated API cost: ${cost}")
-        with open(docx_file, "rb") as docf:
-            st.download_button("📥 Download .DOCX", docf, file_name=os.path.basename(docx_file))
+        st.download_button(
+            "📥 Download .DOCX",
+            data=docx_bytes,
+            file_name=REPORT_FILENAME,
+            mime=DOCX_MIME,
+        )
 
 # === ENTRY POINT ===
 